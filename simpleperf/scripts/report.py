@@ -24,11 +24,13 @@ simpleperf report command. The reporter will call `simpleperf report` to
 generate report file, and display it.
 """
 
+import hashlib
 import os
 import os.path
-import re
+import pickle
 import subprocess
 import sys
+import tempfile
 
 try:
     from tkinter import *
@@ -39,156 +41,13 @@ except ImportError:
     from tkFont import Font
     from ttk import *
 
+from report_parser import CACHE_FORMAT_VERSION, parse_event_reports
 from simpleperf_utils import *
 
 PAD_X = 3
 PAD_Y = 3
 
 
-class CallTreeNode(object):
-
-    """Representing a node in call-graph."""
-
-    def __init__(self, percentage, function_name):
-        self.percentage = percentage
-        self.call_stack = [function_name]
-        self.children = []
-
-    def add_call(self, function_name):
-        self.call_stack.append(function_name)
-
-    def add_child(self, node):
-        self.children.append(node)
-
-    def __str__(self):
-        strs = self.dump()
-        return '\n'.join(strs)
-
-    def dump(self):
-        strs = []
-        strs.append('CallTreeNode percentage = %.2f' % self.percentage)
-        for function_name in self.call_stack:
-            strs.append(' %s' % function_name)
-        for child in self.children:
-            child_strs = child.dump()
-            strs.extend(['  ' + x for x in child_strs])
-        return strs
-
-
-class ReportItem(object):
-
-    """Representing one item in report, may contain a CallTree."""
-
-    def __init__(self, raw_line):
-        self.raw_line = raw_line
-        self.call_tree = None
-
-    def __str__(self):
-        strs = []
-        strs.append('ReportItem (raw_line %s)' % self.raw_line)
-        if self.call_tree is not None:
-            strs.append('%s' % self.call_tree)
-        return '\n'.join(strs)
-
-
-class EventReport(object):
-
-    """Representing report for one event attr."""
-
-    def __init__(self, common_report_context):
-        self.context = common_report_context[:]
-        self.title_line = None
-        self.report_items = []
-
-
-def parse_event_reports(lines):
-    # Parse common report context
-    common_report_context = []
-    line_id = 0
-    while line_id < len(lines):
-        line = lines[line_id]
-        if not line or line.find('Event:') == 0:
-            break
-        common_report_context.append(line)
-        line_id += 1
-
-    event_reports = []
-    in_report_context = True
-    cur_event_report = EventReport(common_report_context)
-    cur_report_item = None
-    call_tree_stack = {}
-    vertical_columns = []
-    last_node = None
-
-    has_skipped_callgraph = False
-
-    for line in lines[line_id:]:
-        if not line:
-            in_report_context = not in_report_context
-            if in_report_context:
-                cur_event_report = EventReport(common_report_context)
-            continue
-
-        if in_report_context:
-            cur_event_report.context.append(line)
-            if line.find('Event:') == 0:
-                event_reports.append(cur_event_report)
-            continue
-
-        if cur_event_report.title_line is None:
-            cur_event_report.title_line = line
-        elif not line[0].isspace():
-            cur_report_item = ReportItem(line)
-            cur_event_report.report_items.append(cur_report_item)
-            # Each report item can have different column depths.
-            vertical_columns = []
-        else:
-            for i in range(len(line)):
-                if line[i] == '|':
-                    if not vertical_columns or vertical_columns[-1] < i:
-                        vertical_columns.append(i)
-
-            if not line.strip('| \t'):
-                continue
-            if 'skipped in brief callgraph mode' in line:
-                has_skipped_callgraph = True
-                continue
-
-            if line.find('-') == -1:
-                line = line.strip('| \t')
-                function_name = line
-                last_node.add_call(function_name)
-            else:
-                pos = line.find('-')
-                depth = -1
-                for i in range(len(vertical_columns)):
-                    if pos >= vertical_columns[i]:
-                        depth = i
-                assert depth != -1
-
-                line = line.strip('|- \t')
-                m = re.search(r'^([\d\.]+)%[-\s]+(.+)$', line)
-                if m:
-                    percentage = float(m.group(1))
-                    function_name = m.group(2)
-                else:
-                    percentage = 100.0
-                    function_name = line
-
-                node = CallTreeNode(percentage, function_name)
-                if depth == 0:
-                    cur_report_item.call_tree = node
-                else:
-                    call_tree_stack[depth - 1].add_child(node)
-                call_tree_stack[depth] = node
-                last_node = node
-
-    if has_skipped_callgraph:
-        log_warning('some callgraphs are skipped in brief callgraph mode')
-
-    return event_reports
-
-
 class ReportWindow(object):
 
     """A window used to display report file."""
@@ -199,18 +58,11 @@ class ReportWindow(object):
 
         font = Font(family='courier', size=12)
 
-        # Report Context
-        for line in report_context:
-            label = Label(frame, text=line, font=font)
-            label.pack(anchor=W, padx=PAD_X, pady=PAD_Y)
-
-        # Space
-        label = Label(frame, text='', font=font)
-        label.pack(anchor=W, padx=PAD_X, pady=PAD_Y)
-
-        # Title
-        label = Label(frame, text='  ' + title_line, font=font)
-        label.pack(anchor=W, padx=PAD_X, pady=PAD_Y)
+        # Report Context, Space and Title, shown in a single read-only text widget.
+        context_text = Text(frame, font=font, height=len(report_context) + 2, wrap='none')
+        context_text.insert('1.0', '\n'.join(report_context) + '\n\n  ' + title_line)
+        context_text.config(state='disabled')
+        context_text.pack(anchor=W, fill=X, padx=PAD_X, pady=PAD_Y)
 
         # Report Items
         report_frame = Frame(frame)
@@ -222,7 +74,6 @@ class ReportWindow(object):
         xscrollbar.pack(side=BOTTOM, fill=X)
 
         tree = Treeview(report_frame, columns=[title_line], show='')
-        tree.pack(side=LEFT, fill=BOTH, expand=1)
         tree.tag_configure('set_font', font=font)
 
         tree.config(yscrollcommand=yscrollbar.set)
@@ -230,51 +81,152 @@ class ReportWindow(object):
         tree.config(xscrollcommand=xscrollbar.set)
         xscrollbar.config(command=tree.xview)
 
+        # Call-graph rows are only inserted when their parent row is opened. Map from the id
+        # of a closed row to the (call tree nodes, indent) to display under it.
+        self.pending_children = {}
+        # Map from the id of a report item row to the report item whose call tree hasn't been
+        # parsed and displayed yet.
+        self.pending_report_items = {}
+        tree.bind('<<TreeviewOpen>>', self.expand_call_tree)
+
+        # Fill the tree before mapping it, so Tk lays it out once instead of per insert.
         self.display_report_items(tree, report_items)
+        tree.pack(side=LEFT, fill=BOTH, expand=1)
 
     def display_report_items(self, tree, report_items):
         for report_item in report_items:
-            prefix_str = '+ ' if report_item.call_tree is not None else '  '
-            id = tree.insert(
-                '',
-                'end',
-                None,
-                values=[
-                    prefix_str +
-                    report_item.raw_line],
-                tag='set_font')
-            if report_item.call_tree is not None:
-                self.display_call_tree(tree, id, report_item.call_tree, 1)
-
-    def display_call_tree(self, tree, parent_id, node, indent):
-        id = parent_id
-        indent_str = '    ' * indent
-
-        if node.percentage != 100.0:
-            percentage_str = '%.2f%% ' % node.percentage
-        else:
-            percentage_str = ''
-
-        for i in range(len(node.call_stack)):
-            s = indent_str
-            s += '+ ' if node.children and i == len(node.call_stack) - 1 else '  '
-            s += percentage_str if i == 0 else ' ' * len(percentage_str)
-            s += node.call_stack[i]
-            child_open = False if i == len(node.call_stack) - 1 and indent > 1 else True
-            id = tree.insert(id, 'end', None, values=[s], open=child_open,
+            has_call_tree = report_item.has_call_tree()
+            prefix_str = '+ ' if has_call_tree else '  '
+            id = tree.insert('', 'end', None, values=(prefix_str + report_item.raw_line,),
                              tag='set_font')
+            if has_call_tree:
+                self.add_placeholder_child(tree, id)
+                self.pending_report_items[id] = report_item
+
+    def add_pending_children(self, tree, parent_id, nodes, indent):
+        self.add_placeholder_child(tree, parent_id)
+        self.pending_children[parent_id] = (nodes, indent)
+
+    def add_placeholder_child(self, tree, parent_id):
+        # Insert a placeholder row, so the parent row can be opened.
+        tree.insert(parent_id, 'end', None, values=('',))
+
+    def expand_call_tree(self, event):
+        tree = event.widget
+        id = tree.focus()
+        report_item = self.pending_report_items.pop(id, None)
+        if report_item is not None:
+            call_tree = report_item.call_tree
+            nodes, indent = ([call_tree] if call_tree is not None else []), 1
+        else:
+            pending = self.pending_children.pop(id, None)
+            if pending is None:
+                return
+            nodes, indent = pending
+        tree.delete(*tree.get_children(id))
+        for node in nodes:
+            self.display_call_tree(tree, id, node, indent)
 
-        for child in node.children:
-            self.display_call_tree(tree, id, child, indent + 1)
-
+    def display_call_tree(self, tree, parent_id, node, indent):
+        stack = [(parent_id, node, indent)]
+        while stack:
+            id, node, indent = stack.pop()
+            indent_str = '    ' * indent
+            last = len(node.rendered_rows) - 1
+
+            for i, row in enumerate(node.rendered_rows):
+                child_open = i != last or indent == 1
+                id = tree.insert(id, 'end', None, values=(indent_str + row,), open=child_open,
+                                 tag='set_font')
+
+            if not node.children:
+                continue
+            if child_open:
+                for child in reversed(node.children):
+                    stack.append((id, child, indent + 1))
+            else:
+                self.add_pending_children(tree, id, node.children, indent + 1)
+
+
+def parse_report_file(report_file):
+    # Use a large buffer to reduce read syscalls on big reports.
+    with open(report_file, 'r', buffering=1 << 20, encoding='utf-8', errors='replace') as fh:
+        return parse_event_reports(fh)
+
+
+# Cached reports are about as big as the report files, so only keep the recently used ones.
+MAX_CACHED_REPORTS = 10
+
+
+def get_cache_dir():
+    return os.path.join(os.path.expanduser('~'), '.cache', 'simpleperf')
+
+
+def prune_report_caches(cache_dir, max_count):
+    """Remove all but the max_count most recently used report caches in cache_dir."""
+    cache_files = []
+    for name in os.listdir(cache_dir):
+        if name.startswith('report_') and name.endswith('.pkl'):
+            path = os.path.join(cache_dir, name)
+            try:
+                cache_files.append((os.path.getmtime(path), path))
+            except OSError:
+                # Removed by another run.
+                pass
+    cache_files.sort(reverse=True)
+    for _, path in cache_files[max_count:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_event_reports(report_file, use_cache):
+    """Parse report_file. If use_cache is set, reuse the cached result if the file is unchanged.
+
+    The cache is kept in the user's cache dir rather than next to the report, as unpickling
+    can run code, and reports (with files next to them) may come from other people.
+    """
+    if not use_cache:
+        return parse_report_file(report_file)
+
+    report_path = os.path.abspath(report_file)
+    cache_file = os.path.join(
+        get_cache_dir(), 'report_%s.pkl' % hashlib.sha1(str_to_bytes(report_path)).hexdigest())
+    stat = os.stat(report_path)
+    cache_key = (CACHE_FORMAT_VERSION, report_path, stat.st_mtime, stat.st_size)
+    event_reports = None
+    try:
+        with open(cache_file, 'rb') as fh:
+            if pickle.load(fh) == cache_key:
+                event_reports = pickle.load(fh)
+    except Exception:
+        # A missing or broken cache only means the report has to be parsed again.
+        pass
+    if event_reports is not None:
+        # Mark the cache as recently used, see prune_report_caches().
+        try:
+            os.utime(cache_file)
+        except OSError:
+            pass
+        return event_reports
+
+    event_reports = parse_report_file(report_path)
+
+    try:
+        os.makedirs(os.path.dirname(cache_file), mode=0o700, exist_ok=True)
+        with open(cache_file, 'wb') as fh:
+            pickle.dump(cache_key, fh)
+            pickle.dump(event_reports, fh, pickle.HIGHEST_PROTOCOL)
+    except (OSError, pickle.PicklingError, RecursionError):
+        remove(cache_file)
+    else:
+        prune_report_caches(os.path.dirname(cache_file), MAX_CACHED_REPORTS)
+    return event_reports
 
-def display_report_file(report_file, self_kill_after_sec):
-    fh = open(report_file, 'r')
-    lines = fh.readlines()
-    fh.close()
 
-    lines = [x.rstrip() for x in lines]
-    event_reports = parse_event_reports(lines)
+def display_report_file(report_file, self_kill_after_sec, use_cache=False):
+    event_reports = load_event_reports(report_file, use_cache)
 
     if event_reports:
         root = Tk()
@@ -292,6 +244,7 @@ def call_simpleperf_report(args, show_gui, self_kill_after_sec):
     if not show_gui:
         subprocess.check_call([simpleperf_path, 'report'] + args)
     else:
+        # perf.report is regenerated on each run, so it isn't worth caching.
         report_file = 'perf.report'
         subprocess.check_call([simpleperf_path, 'report', '--full-callgraph'] + args +
                               ['-o', report_file])
@@ -300,11 +253,39 @@ def call_simpleperf_report(args, show_gui, self_kill_after_sec):
 
 def get_simpleperf_report_help_msg():
     simpleperf_path = get_host_binary_path('simpleperf')
+    # The help message only depends on the simpleperf binary, so cache it instead of running
+    # simpleperf each time.
+    cache_file = os.path.join(get_cache_dir(), 'report_help.txt')
+    cache_key = '%s %s' % (simpleperf_path, os.path.getmtime(simpleperf_path))
+    try:
+        with open(cache_file, 'r') as fh:
+            if fh.readline().rstrip('\n') == cache_key:
+                return fh.read()
+    except OSError:
+        pass
+
     args = [simpleperf_path, 'report', '-h']
     proc = subprocess.Popen(args, stdout=subprocess.PIPE)
     (stdoutdata, _) = proc.communicate()
     stdoutdata = bytes_to_str(stdoutdata)
-    return stdoutdata[stdoutdata.find('\n') + 1:]
+    help_msg = stdoutdata[stdoutdata.find('\n') + 1:]
+
+    # Don't cache the output of a failed run.
+    if proc.returncode == 0:
+        cache_dir = os.path.dirname(cache_file)
+        tmp_file = None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write a temporary file and move it into place, so a concurrent or interrupted run
+            # can't leave a partial help message after the cache key.
+            with tempfile.NamedTemporaryFile('w', dir=cache_dir, delete=False) as fh:
+                tmp_file = fh.name
+                fh.write(cache_key + '\n' + help_msg)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            if tmp_file:
+                remove(tmp_file)
+    return help_msg
 
 
 def main():
@@ -314,7 +295,7 @@ def main():
         self_kill_after_sec = 1
         args = args[1:]
     if len(args) == 1 and os.path.isfile(args[0]):
-        display_report_file(args[0], self_kill_after_sec=self_kill_after_sec)
+        display_report_file(args[0], self_kill_after_sec=self_kill_after_sec, use_cache=True)
 
     i = 0
     args_for_report_cmd = []
@@ -0,0 +1,309 @@
+#
+# Copyright (C) 2015 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""report_parser.py: parse report files generated by simpleperf report command.
+
+It is used by report.py. It doesn't depend on Tk, and is written to be compilable by mypyc:
+
+  $ mypyc report_parser.py
+
+When the compiled extension is next to report_parser.py, python imports it instead of this file.
+"""
+
+import bisect
+import itertools
+import re
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from simpleperf_utils import log_warning
+
+try:
+    from mypy_extensions import mypyc_attr
+except ImportError:
+    # mypy_extensions is only needed when compiling with mypyc.
+    def mypyc_attr(*attrs, **kwattrs):  # type: ignore[misc]
+        return lambda cls: cls
+
+# Version of the pickled format of the classes below, used to invalidate report caches. Bump it
+# whenever the attributes of these classes change.
+CACHE_FORMAT_VERSION = 2
+
+# Matches a callgraph entry like '12.34%-- function_name'.
+_CALLGRAPH_RE = re.compile(r'([\d.]+)%[-\s]+(.+)$')
+# Matches the vertical bars connecting callgraph entries in the same column.
+_VERTICAL_BAR_RE = re.compile(r'\|')
+
+
+# Keep instances picklable when compiled, see load_event_reports() in report.py.
+@mypyc_attr(serializable=True)
+class CallTreeNode(object):
+
+    """Representing a node in call-graph."""
+
+    __slots__ = ('percentage', 'call_stack', 'children', 'rendered_rows')
+
+    def __init__(self, percentage: float, function_name: str):
+        self.percentage = percentage
+        self.call_stack: List[str] = [function_name]
+        self.children: List[CallTreeNode] = []
+        # Rows displaying call_stack in the gui reporter, without indentation. They are
+        # rendered when the node is complete, see render().
+        self.rendered_rows: List[str] = []
+
+    def add_call(self, function_name: str):
+        self.call_stack.append(function_name)
+
+    def add_child(self, node: 'CallTreeNode'):
+        self.children.append(node)
+
+    def render(self):
+        if self.percentage != 100.0:
+            percentage_str = '%.2f%% ' % self.percentage
+        else:
+            percentage_str = ''
+        blank_percentage_str = ' ' * len(percentage_str)
+        last = len(self.call_stack) - 1
+        self.rendered_rows = [
+            ''.join(('+ ' if self.children and i == last else '  ',
+                     percentage_str if i == 0 else blank_percentage_str,
+                     function_name))
+            for i, function_name in enumerate(self.call_stack)]
+
+    def __str__(self) -> str:
+        strs = self.dump()
+        return '\n'.join(strs)
+
+    def dump(self) -> List[str]:
+        strs: List[str] = []
+        # Walk the tree with an explicit stack, as call-graphs can be deeper than the
+        # recursion limit.
+        stack: List[Tuple[CallTreeNode, str]] = [(self, '')]
+        while stack:
+            node, prefix = stack.pop()
+            strs.append(prefix + 'CallTreeNode percentage = %.2f' % node.percentage)
+            for function_name in node.call_stack:
+                strs.append(prefix + ' %s' % function_name)
+            child_prefix = prefix + '  '
+            for child in reversed(node.children):
+                stack.append((child, child_prefix))
+        return strs
+
+
+# Identifies a complete call tree node by (percentage, call_stack, canonical children).
+CanonicalNodeKey = Tuple[float, Tuple[str, ...], Tuple[CallTreeNode, ...]]
+
+
+@mypyc_attr(serializable=True)
+class ReportItem(object):
+
+    """Representing one item in report, may contain a CallTree.
+
+    The CallTree is parsed from callgraph_lines when it is first used.
+    """
+
+    __slots__ = ('raw_line', 'callgraph_lines', 'event_report', '_call_tree')
+
+    def __init__(self, raw_line: str, event_report: 'EventReport'):
+        self.raw_line = raw_line
+        self.callgraph_lines: List[str] = []
+        # The event report containing this item, which owns the canonical nodes shared by its
+        # report items, see parse_call_tree().
+        self.event_report = event_report
+        self._call_tree: Optional[CallTreeNode] = None
+
+    def has_call_tree(self) -> bool:
+        return self._call_tree is not None or bool(self.callgraph_lines)
+
+    @property
+    def call_tree(self) -> Optional[CallTreeNode]:
+        if self.callgraph_lines:
+            report = self.event_report
+            try:
+                self._call_tree = parse_call_tree(self.callgraph_lines, report.canonical_nodes)
+            except ValueError as e:
+                log_warning('failed to parse callgraph of %s: %s' % (self.raw_line, e))
+            self.callgraph_lines = []
+            report.unparsed_call_trees -= 1
+            if report.unparsed_call_trees == 0:
+                # No call tree is left to share nodes with, so free the table.
+                report.canonical_nodes = {}
+        return self._call_tree
+
+    def __str__(self) -> str:
+        strs = []
+        strs.append('ReportItem (raw_line %s)' % self.raw_line)
+        if self.call_tree is not None:
+            strs.append('%s' % self.call_tree)
+        return '\n'.join(strs)
+
+
+@mypyc_attr(serializable=True)
+class EventReport(object):
+
+    """Representing report for one event attr."""
+
+    __slots__ = ('context', 'title_line', 'report_items', 'canonical_nodes',
+                 'unparsed_call_trees')
+
+    def __init__(self, common_report_context: List[str]):
+        self.context = common_report_context[:]
+        self.title_line: Optional[str] = None
+        self.report_items: List[ReportItem] = []
+        self.canonical_nodes: Dict[CanonicalNodeKey, CallTreeNode] = {}
+        # Number of report items whose callgraph_lines haven't been parsed yet.
+        self.unparsed_call_trees = 0
+
+
+def parse_event_reports(lines: Iterable[str]) -> List[EventReport]:
+    """Parse report lines from an iterable, like a report file opened in text mode.
+
+    Trailing whitespace (including line endings) is removed from each line.
+    """
+    line_iter: Iterator[str] = iter(lines)
+    # Parse common report context. The line ending it is pushed back, and the rest of the
+    # report is parsed from the same iterator.
+    common_report_context: List[str] = []
+    for context_line in line_iter:
+        context_line = context_line.rstrip()
+        if not context_line or context_line.startswith('Event:'):
+            line_iter = itertools.chain((context_line,), line_iter)
+            break
+        common_report_context.append(context_line)
+
+    event_reports: List[EventReport] = []
+    in_report_context = True
+    cur_event_report = EventReport(common_report_context)
+    cur_report_item: Optional[ReportItem] = None
+
+    has_skipped_callgraph = False
+
+    for line in line_iter:
+        line = line.rstrip()
+        if not line:
+            in_report_context = not in_report_context
+            if in_report_context:
+                cur_event_report = EventReport(common_report_context)
+            continue
+
+        if in_report_context:
+            cur_event_report.context.append(line)
+            if line.find('Event:') == 0:
+                event_reports.append(cur_event_report)
+            continue
+
+        if cur_event_report.title_line is None:
+            cur_event_report.title_line = line
+        elif not line[0].isspace():
+            cur_report_item = ReportItem(line, cur_event_report)
+            cur_event_report.report_items.append(cur_report_item)
+        elif 'skipped in brief callgraph mode' in line:
+            has_skipped_callgraph = True
+        else:
+            # Callgraphs are only parsed when needed, see ReportItem.call_tree.
+            assert cur_report_item is not None
+            if not cur_report_item.callgraph_lines:
+                cur_event_report.unparsed_call_trees += 1
+            cur_report_item.callgraph_lines.append(line)
+
+    if has_skipped_callgraph:
+        log_warning('some callgraphs are skipped in brief callgraph mode')
+
+    return event_reports
+
+
+def parse_call_tree(
+        lines: List[str],
+        canonical_nodes: Dict[CanonicalNodeKey, CallTreeNode]) -> Optional[CallTreeNode]:
+    """Parse the callgraph lines of a report item.
+
+    Identical subtrees are common (like the same helper called in many contexts, or the same
+    callees under different report items), so complete subtrees are hash-consed through
+    canonical_nodes to share one instance.
+    """
+    call_tree: Optional[CallTreeNode] = None
+    # call_tree_stack[depth] is the last node seen at that depth of the call tree.
+    call_tree_stack: List[CallTreeNode] = []
+    vertical_columns: List[int] = []
+    last_node: Optional[CallTreeNode] = None
+
+    for line in lines:
+        # Only bars right of the known columns can add new columns, so skip the rest.
+        start = vertical_columns[-1] + 1 if vertical_columns else 0
+        vertical_columns.extend(bar.start() for bar in _VERTICAL_BAR_RE.finditer(line, start))
+
+        body = line.lstrip('| \t')
+        if not body:
+            continue
+
+        # Only a dash right after the bars starts a new node. Function names can contain dashes,
+        # like 'non-virtual thunk to ...'.
+        if not body.startswith('-'):
+            function_name = sys.intern(body.rstrip('| \t'))
+            if last_node is None:
+                raise ValueError('unexpected callgraph line: %s' % line)
+            last_node.add_call(function_name)
+        else:
+            dash_pos = len(line) - len(body)
+            # vertical_columns is sorted, so the depth is the last column left of the dash.
+            depth = bisect.bisect_right(vertical_columns, dash_pos) - 1
+            if depth < 0 or depth > len(call_tree_stack):
+                raise ValueError('unexpected callgraph line: %s' % line)
+
+            line = body.strip('|- \t')
+            m = _CALLGRAPH_RE.match(line)
+            if m:
+                percentage = float(m.group(1))
+                function_name = m.group(2)
+            else:
+                percentage = 100.0
+                function_name = line
+            # The same functions appear many times in a report, so share their names.
+            function_name = sys.intern(function_name)
+
+            # Nodes at the same or deeper depth are complete now.
+            _finish_call_tree_nodes(call_tree_stack, depth, canonical_nodes)
+            node = CallTreeNode(percentage, function_name)
+            if depth == 0:
+                call_tree = node
+            else:
+                call_tree_stack[depth - 1].add_child(node)
+            call_tree_stack.append(node)
+            last_node = node
+    _finish_call_tree_nodes(call_tree_stack, 0, canonical_nodes)
+    return call_tree
+
+
+def _finish_call_tree_nodes(
+        call_tree_stack: List[CallTreeNode],
+        depth: int, canonical_nodes: Dict[CanonicalNodeKey, CallTreeNode]):
+    """Pop complete nodes call_tree_stack[depth:], replacing each with its canonical instance
+    in its parent, and render the rows of new canonical nodes. Nodes are popped deepest first,
+    so children are canonical before their parent is looked up.
+    """
+    for i in range(len(call_tree_stack) - 1, depth - 1, -1):
+        node = call_tree_stack.pop()
+        if i == 0:
+            # The root of a call tree has no parent to share it with.
+            node.render()
+            break
+        key = (node.percentage, tuple(node.call_stack), tuple(node.children))
+        canonical_node = canonical_nodes.setdefault(key, node)
+        if canonical_node is node:
+            node.render()
+        else:
+            # A complete node is always the last child of its parent.
+            call_tree_stack[i - 1].children[-1] = canonical_node
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import textwrap
+from typing import List
+
+from report_parser import EventReport, parse_event_reports
+from . test_utils import TestBase, TestHelper
+
+REPORT = """\
+Cmdline: /data/local/tmp/simpleperf record -g ./a.out
+Arch: arm64
+Event: cpu-cycles (type 0, config 0)
+Samples: 100
+Event count: 1000
+
+Children  Self    Command  Pid  Tid  Shared Object  Symbol
+100.00%   0.00%   a.out    1    1    libc.so        __libc_init
+       |
+       -- __libc_init
+          |
+           -- main
+               |
+               |--60.00%-- Function1()
+               |           Function1_inlined()
+               |
+                --40.00%-- Function2()
+100.00%   0.00%   a.out    1    1    a.out          main
+       |
+       -- main
+          |
+          |--60.00%-- Function1()
+          |           Function1_inlined()
+          |
+           --40.00%-- Function2()
+60.00%    60.00%  a.out    1    1    a.out          Function1()
+"""
+
+
+class TestReportParser(TestBase):
+    def parse_report(self) -> List[EventReport]:
+        return parse_event_reports(REPORT.splitlines(keepends=True))
+
+    def test_parse_event_reports(self):
+        event_reports = self.parse_report()
+        self.assertEqual(len(event_reports), 1)
+        event_report = event_reports[0]
+        self.assertEqual(event_report.context[-1], 'Event count: 1000')
+        self.assertTrue(event_report.title_line.startswith('Children  Self'))
+        self.assertEqual(len(event_report.report_items), 3)
+        self.assertFalse(event_report.report_items[2].has_call_tree())
+        self.assertIsNone(event_report.report_items[2].call_tree)
+
+    def test_call_tree(self):
+        report_item = self.parse_report()[0].report_items[0]
+        self.assertEqual(str(report_item.call_tree), textwrap.dedent("""\
+            CallTreeNode percentage = 100.00
+             __libc_init
+              CallTreeNode percentage = 100.00
+               main
+                CallTreeNode percentage = 60.00
+                 Function1()
+                 Function1_inlined()
+                CallTreeNode percentage = 40.00
+                 Function2()"""))
+        self.assertEqual(report_item.call_tree.children[0].children[0].rendered_rows,
+                         ['  60.00% Function1()', '         Function1_inlined()'])
+
+    def test_lazy_call_tree(self):
+        event_report = self.parse_report()[0]
+        report_item = event_report.report_items[0]
+        self.assertTrue(report_item.has_call_tree())
+        self.assertTrue(report_item.callgraph_lines)
+        self.assertEqual(event_report.unparsed_call_trees, 2)
+        call_tree = report_item.call_tree
+        self.assertIsNotNone(call_tree)
+        self.assertFalse(report_item.callgraph_lines)
+        self.assertIs(report_item.call_tree, call_tree)
+        self.assertEqual(event_report.unparsed_call_trees, 1)
+
+    def test_share_identical_subtrees(self):
+        event_report = self.parse_report()[0]
+        main_node1 = event_report.report_items[0].call_tree.children[0]
+        main_node2 = event_report.report_items[1].call_tree
+        self.assertEqual(main_node1.call_stack, main_node2.call_stack)
+        for child1, child2 in zip(main_node1.children, main_node2.children):
+            self.assertIs(child1, child2)
+        # The table of canonical nodes is freed after all call trees are parsed.
+        self.assertEqual(event_report.unparsed_call_trees, 0)
+        self.assertFalse(event_report.canonical_nodes)
+
+    def test_function_name_with_dash(self):
+        # A dash in a continuation line doesn't start a new node.
+        report = REPORT.replace(' Function1_inlined()', ' non-virtual thunk to Function1_inlined()')
+        event_report = parse_event_reports(report.splitlines(keepends=True))[0]
+        main_node = event_report.report_items[1].call_tree
+        self.assertEqual(len(main_node.children), 2)
+        self.assertEqual(main_node.children[0].call_stack,
+                         ['Function1()', 'non-virtual thunk to Function1_inlined()'])
+        self.assertEqual(main_node.children[1].call_stack, ['Function2()'])
+
+    def test_malformed_call_tree(self):
+        # A node deeper than its parent's depth + 1 can't be parsed.
+        report = REPORT.replace('               |--60.00%-- Function1()',
+                                '               |    |--60.00%-- Function1()')
+        event_report = parse_event_reports(report.splitlines(keepends=True))[0]
+        self.assertIsNone(event_report.report_items[0].call_tree)
+        self.assertEqual(event_report.unparsed_call_trees, 1)
+
+    def test_parse_report_file(self):
+        # The report is cut from a report of aggregatable_perf1.data, and has function names
+        # containing dashes.
+        with open(TestHelper.testdata_path('report_parser_report.txt')) as fh:
+            event_reports = parse_event_reports(fh)
+        with open(TestHelper.testdata_path('report_parser_call_trees.txt')) as fh:
+            expected_report_items = fh.read().rstrip('\n').split('\n\n')
+        self.assertEqual(len(event_reports), 1)
+        report_items = event_reports[0].report_items
+        self.assertEqual(len(report_items), len(expected_report_items))
+        for report_item, expected in zip(report_items, expected_report_items):
+            self.assertEqual(str(report_item), expected)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 The Android Open Source Project
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+from typing import List, Tuple
+from unittest import mock
+
+import report
+from report_parser import EventReport
+from . test_utils import TestBase, TestHelper
+
+
+class TestReport(TestBase):
+    def setUp(self):
+        super(TestReport, self).setUp()
+        self.cache_dir = str(self.test_dir / 'cache')
+        self.set_cache_dir(self.cache_dir)
+        self.report_file = 'perf.report'
+        shutil.copyfile(TestHelper.testdata_path('report_parser_report.txt'), self.report_file)
+
+    def set_cache_dir(self, cache_dir: str):
+        patcher = mock.patch('report.get_cache_dir', return_value=cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def load_event_reports(self) -> Tuple[List[EventReport], bool]:
+        """Return the loaded event reports, and whether the report file is parsed."""
+        with mock.patch('report.parse_report_file', wraps=report.parse_report_file) as parse:
+            event_reports = report.load_event_reports(self.report_file, use_cache=True)
+        self.assertEqual(len(event_reports), 1)
+        self.assertEqual(len(event_reports[0].report_items), 3)
+        return event_reports, parse.called
+
+    def get_cache_files(self) -> List[str]:
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_cache_hit(self):
+        event_reports, parsed = self.load_event_reports()
+        self.assertTrue(parsed)
+        self.assertEqual(len(self.get_cache_files()), 1)
+        cached_event_reports, parsed = self.load_event_reports()
+        self.assertFalse(parsed)
+        for report_item, cached_report_item in zip(event_reports[0].report_items,
+                                                   cached_event_reports[0].report_items):
+            self.assertEqual(str(report_item), str(cached_report_item))
+
+    def test_stale_cache(self):
+        self.load_event_reports()
+        mtime = os.path.getmtime(self.report_file) + 10
+        os.utime(self.report_file, (mtime, mtime))
+        _, parsed = self.load_event_reports()
+        self.assertTrue(parsed)
+        _, parsed = self.load_event_reports()
+        self.assertFalse(parsed)
+
+    def test_corrupt_cache(self):
+        self.load_event_reports()
+        for name in self.get_cache_files():
+            with open(os.path.join(self.cache_dir, name), 'wb') as fh:
+                fh.write(b'corrupt')
+        _, parsed = self.load_event_reports()
+        self.assertTrue(parsed)
+        _, parsed = self.load_event_reports()
+        self.assertFalse(parsed)
+
+    def test_unwritable_cache_dir(self):
+        # The cache dir can't be created under a file.
+        with open('cache_file', 'w') as fh:
+            fh.write('')
+        self.set_cache_dir(os.path.join('cache_file', 'cache'))
+        for _ in range(2):
+            _, parsed = self.load_event_reports()
+            self.assertTrue(parsed)
+
+    def test_prune_report_caches(self):
+        os.mkdir(self.cache_dir)
+        old_cache_files = ['report_%02d.pkl' % i for i in range(report.MAX_CACHED_REPORTS + 2)]
+        for i, name in enumerate(old_cache_files):
+            path = os.path.join(self.cache_dir, name)
+            with open(path, 'wb') as fh:
+                fh.write(b'')
+            os.utime(path, (i, i))
+        self.load_event_reports()
+        cache_files = self.get_cache_files()
+        self.assertEqual(len(cache_files), report.MAX_CACHED_REPORTS)
+        # The new cache and the most recently used old caches are kept.
+        self.assertEqual(len(set(cache_files) - set(old_cache_files)), 1)
+        self.assertTrue(set(old_cache_files[-report.MAX_CACHED_REPORTS + 1:]) <= set(cache_files))
+
+    def test_help_msg_cache(self):
+        with mock.patch('report.subprocess.Popen', wraps=subprocess.Popen) as popen:
+            help_msg = report.get_simpleperf_report_help_msg()
+            self.assertEqual(popen.call_count, 1)
+            self.assertIn('--full-callgraph', help_msg)
+            self.assertEqual(self.get_cache_files(), ['report_help.txt'])
+            self.assertEqual(report.get_simpleperf_report_help_msg(), help_msg)
+            self.assertEqual(popen.call_count, 1)
+
+    def test_help_msg_not_cached_on_failure(self):
+        with mock.patch('report.subprocess.Popen') as popen:
+            popen.return_value.communicate.return_value = (b'error\nhelp', None)
+            popen.return_value.returncode = 1
+            self.assertEqual(report.get_simpleperf_report_help_msg(), 'help')
+        self.assertFalse(os.path.exists(self.cache_dir))